@@ -0,0 +1,82 @@
+import os
+import time
+import tempfile
+
+# -----------------------------
+# Session Artifact Cache
+# -----------------------------
+# Generated files (e.g. the PDFs returned by the chat webhooks) are streamed to
+# disk in chunks instead of being held in memory, one directory per session.
+# The cache is trimmed by age and total size whenever something new is saved.
+#
+#   ARTIFACT_DIR          where artifacts are kept (default: <tmp>/dtcmode-artifacts)
+#   ARTIFACT_MAX_BYTES    total size budget across all sessions (default: 500 MB)
+#   ARTIFACT_TTL_SECONDS  maximum age of an artifact (default: 1 day)
+
+ARTIFACT_DIR         = os.getenv('ARTIFACT_DIR') or os.path.join(tempfile.gettempdir(), 'dtcmode-artifacts')
+ARTIFACT_MAX_BYTES   = int(os.getenv('ARTIFACT_MAX_BYTES', str(500 * 1024 * 1024)))
+ARTIFACT_TTL_SECONDS = int(os.getenv('ARTIFACT_TTL_SECONDS', str(24 * 3600)))
+ARTIFACT_CHUNK_BYTES = 1024 * 1024
+
+
+def _path(session_id, name):
+    return os.path.join(ARTIFACT_DIR, os.path.basename(session_id), os.path.basename(name))
+
+
+def save_response(session_id, name, resp):
+    # Stream a requests response (sent with stream=True) into the session's cache
+    path = _path(session_id, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in resp.iter_content(chunk_size=ARTIFACT_CHUNK_BYTES):
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    finally:
+        resp.close()
+    evict()
+    return path
+
+
+def reader(session_id, name):
+    # Zero-argument callable for st.download_button, or None if the file is gone.
+    # The file is only read when the user actually clicks download.
+    path = _path(session_id, name)
+    if not os.path.exists(path):
+        return None
+
+    def read():
+        # Touch the file so recently downloaded artifacts are evicted last
+        os.utime(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    return read
+
+
+def evict():
+    # Drop expired artifacts, then the least recently used ones until under budget
+    entries = []
+    for root, _, files in os.walk(ARTIFACT_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    cutoff = time.time() - ARTIFACT_TTL_SECONDS
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if mtime >= cutoff and total <= ARTIFACT_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,251 @@
+"""Run the n8n pipelines headlessly over a directory of brands.
+
+Each sub-directory of BRANDS_DIR is one brand; every PDF/TXT file found under
+it is uploaded, exactly as the Streamlit tabs would. One JSON line per
+(brand, pipeline) is appended to the results file, and brands that already
+succeeded are skipped on the next run, so an interrupted batch can simply be
+started again.
+
+When CALLBACK_BASE_URL is set, n8n acknowledges each submission at once and
+reports back through the callback receiver; a submission only counts as `ok`
+once that result has arrived. With --no-wait such submissions are recorded as
+`accepted` and run again on the next batch.
+
+Ctrl-C stops starting new submissions and records the ones already sent
+(without waiting for their callbacks); a second Ctrl-C quits immediately.
+
+    python batch.py brands/ --email am@dtcmode.com --pipelines icp,strategy,master
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import callbacks
+import pipelines
+from webhooks import submit_webhook
+
+# Set on Ctrl-C so workers stop waiting and report what they have
+stopping = threading.Event()
+
+
+class Cancelled(Exception):
+    pass
+
+
+def find_brands(brands_dir):
+    # brand name -> sorted list of uploadable file paths
+    brands = {}
+    for entry in sorted(os.scandir(brands_dir), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        paths = []
+        for root, _, files in os.walk(entry.path):
+            paths.extend(
+                os.path.join(root, name) for name in files
+                if name.lower().endswith(('.pdf', '.txt'))
+            )
+        brands[entry.name] = sorted(paths)
+    return brands
+
+
+def load_completed(results_path):
+    # (brand, pipeline) pairs that already succeeded in an earlier run
+    completed = set()
+    if not os.path.exists(results_path):
+        return completed
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if record.get('status') == 'ok':
+                completed.add((record['brand'], record['pipeline']))
+    return completed
+
+
+def wait_for_job(job):
+    # Queue time is bounded by the jobs ahead of us; once sent, give up after
+    # the request's own connect + read timeout
+    deadline = None
+    while not job.wait(timeout=0.5):
+        if stopping.is_set() and job.cancel():
+            raise Cancelled('interrupted before it was sent')
+        if deadline is None and not job.queue_position():
+            deadline = time.monotonic() + sum(job.timeout)
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"no response after {sum(job.timeout):.0f}s")
+    return job.result()
+
+
+def wait_for_callback(correlation_id):
+    # Block until n8n posts the result, or the callback expires; None when interrupted
+    deadline = time.monotonic() + callbacks.CALLBACK_TTL_SECONDS
+    while time.monotonic() < deadline:
+        if stopping.is_set():
+            return None
+        entry = callbacks.registry.get(correlation_id)
+        if entry is None:
+            break
+        if entry['done']:
+            callbacks.registry.discard(correlation_id)
+            return entry['result']
+        time.sleep(callbacks.CALLBACK_POLL_SECONDS)
+    raise TimeoutError('no callback received before the job expired')
+
+
+def run_one(brand, paths, pipeline, email, wait=True):
+    _, url_env, max_txt_files = pipelines.PIPELINES[pipeline]
+    record = {
+        'brand': brand,
+        'pipeline': pipeline,
+        'files': [os.path.basename(p) for p in paths],
+        'bytes': sum(os.path.getsize(p) for p in paths),
+        'started_at': time.time(),
+    }
+
+    url = pipelines.webhook_url(pipeline)
+    if not paths:
+        error = 'No PDF or TXT files found.'
+    elif not url:
+        error = f"Missing {url_env} in the environment variables."
+    else:
+        error = pipelines.upload_error([(os.path.basename(p), os.path.getsize(p)) for p in paths], max_txt_files)
+    if error:
+        record.update(status='invalid', error=error, elapsed_s=0.0)
+        return record
+
+    files = []
+    for p in paths:
+        with open(p, 'rb') as f:
+            files.append((os.path.basename(p), f.read()))
+
+    data = {'email': email}
+    correlation_id = callbacks.attach(data)
+    started = time.monotonic()
+    try:
+        # Same shared queue and adaptive timeouts as the app; the brand is the tenant
+        resp = wait_for_job(submit_webhook(
+            url, brand,
+            files=pipelines.files_payload(files),
+            data=data
+        ))
+        record['http_status'] = resp.status_code
+        if not resp.ok:
+            record.update(status='error', error=resp.text[:1000])
+        elif not correlation_id:
+            record['status'] = 'ok'
+        elif not wait:
+            # Only acknowledged; not counted as done, so the next run retries it
+            record.update(status='accepted', correlation_id=correlation_id)
+        else:
+            # The 2xx was only the acknowledgement; the workflow is done when the callback arrives
+            record['acknowledged_s'] = round(time.monotonic() - started, 3)
+            if wait_for_callback(correlation_id) is None:
+                # Interrupted: sent and acknowledged, but not known to be done
+                record.update(status='accepted', correlation_id=correlation_id)
+            else:
+                record['status'] = 'ok'
+    except Cancelled as e:
+        record.update(status='cancelled', error=str(e))
+    except Exception as e:
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    record['elapsed_s'] = round(time.monotonic() - started, 3)
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('brands_dir', help='directory with one sub-directory per brand')
+    parser.add_argument('--email', required=True, help='email address sent with every submission')
+    parser.add_argument(
+        '--pipelines', default=','.join(pipelines.PIPELINES),
+        help=f"comma-separated pipelines to run (default: all of {', '.join(pipelines.PIPELINES)})"
+    )
+    parser.add_argument('--concurrency', type=int, default=4, help='submissions in flight at once (default: 4)')
+    parser.add_argument('--results', default='batch_results.jsonl', help='JSONL results file (default: batch_results.jsonl)')
+    parser.add_argument('--no-resume', action='store_true', help='run everything again, even brands that already succeeded')
+    parser.add_argument(
+        '--no-wait', action='store_true',
+        help="with callbacks enabled, record submissions as 'accepted' instead of waiting for n8n to finish"
+    )
+    args = parser.parse_args(argv)
+
+    selected = [p.strip() for p in args.pipelines.split(',') if p.strip()]
+    unknown = [p for p in selected if p not in pipelines.PIPELINES]
+    if unknown:
+        parser.error(f"unknown pipeline(s): {', '.join(unknown)}")
+
+    brands = find_brands(args.brands_dir)
+    completed = set() if args.no_resume else load_completed(args.results)
+    tasks = [
+        (brand, paths, pipeline)
+        for brand, paths in brands.items()
+        for pipeline in selected
+        if (brand, pipeline) not in completed
+    ]
+    skipped = len(brands) * len(selected) - len(tasks)
+    print(f"{len(brands)} brands, {len(tasks)} submissions to run, {skipped} already done", file=sys.stderr)
+
+    failures = 0
+    written = 0
+
+    def write(record):
+        nonlocal failures, written
+        written += 1
+        record['finished_at'] = time.time()
+        # Flushed per line so progress survives an interrupted run
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+        if record['status'] not in ('ok', 'accepted', 'cancelled'):
+            failures += 1
+        print(
+            f"[{written}/{len(tasks)}] {record['brand']} / {record['pipeline']}: "
+            f"{record['status']} ({record['elapsed_s']:.1f}s)"
+            + (f" – {record['error']}" if record.get('error') else ''),
+            file=sys.stderr
+        )
+
+    with open(args.results, 'a') as out:
+        pool = ThreadPoolExecutor(max_workers=args.concurrency)
+        futures = [pool.submit(run_one, brand, paths, pipeline, args.email, not args.no_wait) for brand, paths, pipeline in tasks]
+        pending = set(futures)
+        try:
+            for future in as_completed(futures):
+                pending.discard(future)
+                write(future.result())
+        except KeyboardInterrupt:
+            # Stop before anything else is sent, then record what already was
+            stopping.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            print('Interrupted – recording submissions already sent (Ctrl-C again to quit now)', file=sys.stderr)
+            interrupted = time.monotonic()
+            running = {f for f in pending if not f.cancelled()}
+            while running:
+                try:
+                    for future in as_completed(running):
+                        running.discard(future)
+                        write(future.result())
+                except KeyboardInterrupt:
+                    # `timeout -s INT` and some shells deliver the same Ctrl-C twice
+                    if time.monotonic() - interrupted < 1:
+                        continue
+                    out.flush()
+                    # Worker threads may still be blocked on the network; don't join them
+                    os._exit(130)
+            return 130
+        pool.shutdown()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from session_store import get_session_store
+
+# -----------------------------
+# Webhook Completion Callbacks
+# -----------------------------
+# Long n8n workflows no longer hold an HTTP request open. When
+# CALLBACK_BASE_URL is set, the app sends `callback_url` and `correlation_id`
+# along with the upload; n8n answers the webhook straight away and, once the
+# workflow is done, POSTs its result to callback_url. A small receiver started
+# with the app writes that result to the shared session store, where any
+# worker can pick it up for the session that is polling for it, even after a
+# restart. Workers on the same host share one receiver: whichever binds the
+# port first serves it, and the others check that it answers.
+#
+#   CALLBACK_BASE_URL      how n8n reaches the receiver, e.g. http://app-1:8502
+#   CALLBACK_HOST          interface the receiver binds to (default: 0.0.0.0)
+#   CALLBACK_PORT          port the receiver listens on (default: 8502)
+#   CALLBACK_MAX_BYTES     largest callback body accepted (default: 10 MB)
+#   CALLBACK_TTL_SECONDS   how long unclaimed results are kept (default: 1 hour)
+#   CALLBACK_POLL_SECONDS  how often a waiting page checks for its result (default: 3)
+
+CALLBACK_BASE_URL     = os.getenv('CALLBACK_BASE_URL', '').rstrip('/')
+CALLBACK_HOST         = os.getenv('CALLBACK_HOST', '0.0.0.0')
+CALLBACK_PORT         = int(os.getenv('CALLBACK_PORT', '8502'))
+CALLBACK_MAX_BYTES    = int(os.getenv('CALLBACK_MAX_BYTES', str(10 * 1024 * 1024)))
+CALLBACK_TTL_SECONDS  = int(os.getenv('CALLBACK_TTL_SECONDS', '3600'))
+CALLBACK_POLL_SECONDS = float(os.getenv('CALLBACK_POLL_SECONDS', '3'))
+
+
+class CallbackRegistry:
+    def __init__(self, store):
+        # Any session store backend; results live there, not in this process
+        self.store = store
+
+    def register(self):
+        correlation_id = uuid.uuid4().hex
+        self.store.register_callback(correlation_id, CALLBACK_TTL_SECONDS)
+        return correlation_id
+
+    def complete(self, correlation_id, result):
+        # False when the id is unknown or expired
+        return self.store.complete_callback(correlation_id, result)
+
+    def get(self, correlation_id):
+        return self.store.load_callback(correlation_id, CALLBACK_TTL_SECONDS)
+
+    def discard(self, correlation_id):
+        self.store.discard_callback(correlation_id)
+
+
+registry = CallbackRegistry(get_session_store())
+
+HEALTH_BODY = b'dtcmode-callbacks'
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'callback':
+            self.send_error(404)
+            return
+
+        # The listener is unauthenticated, so never read more than the cap;
+        # chunked bodies without a length are refused rather than stored empty
+        if self.headers.get('Content-Length') is None:
+            self.send_error(411, 'Content-Length required')
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            self.send_error(400, 'Invalid Content-Length')
+            return
+        if length > CALLBACK_MAX_BYTES:
+            self.send_error(413, 'Callback body too large')
+            return
+        body = self.rfile.read(length)
+        if not body.strip():
+            self.send_error(400, 'Empty callback body')
+            return
+        try:
+            result = json.loads(body)
+        except ValueError:
+            result = body.decode(errors='ignore')
+
+        if registry.complete(parts[1], result):
+            self.send_response(200)
+            self.end_headers()
+        else:
+            self.send_error(404, 'Unknown correlation id')
+
+    def do_GET(self):
+        # Lets sibling workers on this host confirm who holds the port
+        if self.path != '/health':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(HEALTH_BODY)))
+        self.end_headers()
+        self.wfile.write(HEALTH_BODY)
+
+    def log_message(self, format, *args):
+        # Keep the Streamlit console quiet
+        pass
+
+
+_server = None
+_receiver_ok = False
+_last_attempt = 0.0
+_server_lock = threading.Lock()
+
+
+def enabled():
+    return bool(CALLBACK_BASE_URL)
+
+
+def sibling_receiver():
+    # True when another worker on this host already serves the callback port
+    host = '127.0.0.1' if CALLBACK_HOST in ('0.0.0.0', '') else CALLBACK_HOST
+    try:
+        resp = requests.get(f"http://{host}:{CALLBACK_PORT}/health", timeout=2)
+    except requests.exceptions.RequestException:
+        return False
+    return resp.ok and resp.content == HEALTH_BODY
+
+
+def start_receiver():
+    # Serve the receiver from this process, or confirm a sibling worker does.
+    # Returns False when nothing answers on the port, so callers stay synchronous.
+    global _server, _receiver_ok, _last_attempt
+    with _server_lock:
+        # A failed attempt is retried at most once a minute, not on every rerun
+        if not _receiver_ok and time.monotonic() - _last_attempt > 60:
+            _last_attempt = time.monotonic()
+            try:
+                _server = ThreadingHTTPServer((CALLBACK_HOST, CALLBACK_PORT), CallbackHandler)
+            except OSError:
+                _receiver_ok = sibling_receiver()
+            else:
+                _server.daemon_threads = True
+                threading.Thread(target=_server.serve_forever, name='callback-receiver', daemon=True).start()
+                _receiver_ok = True
+        return _receiver_ok
+
+
+def attach(data):
+    # Add callback fields to a webhook form payload and return the correlation id,
+    # or None when callbacks are not available and the call should stay synchronous
+    if not enabled() or not start_receiver():
+        return None
+    correlation_id = registry.register()
+    data['correlation_id'] = correlation_id
+    data['callback_url'] = f"{CALLBACK_BASE_URL}/callback/{correlation_id}"
+    return correlation_id
@@ -3,12 +3,33 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import time
 import uuid
+import hmac
+import hashlib
 import io
+import csv
+import json
 import pandas as pd
 import requests
 from docx import Document
+from docx.table import Table
+from openpyxl import load_workbook
 from PyPDF2 import PdfReader
+from session_store import get_session_store, snapshot
+from webhooks import submit_webhook, admission, latency, WebhookBusy
+import callbacks
+import artifacts
+import pipelines
+import tracing
+import miro_layout
+
+# Time this whole rerun; closed in the dispatcher's finally block
+tracing.begin('rerun')
+
+# Bring the callback receiver up with the app rather than on the first submission
+if callbacks.enabled():
+    callbacks.start_receiver()
 
 # -----------------------------
 # App Configuration & CSS
@@ -27,13 +48,37 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# -----------------------------
+# Session Store
+# -----------------------------
+@st.cache_resource
+def session_store():
+    # Shared backend so any worker process can pick up a conversation
+    return get_session_store()
+
 # -----------------------------
 # Session State Initialization
 # -----------------------------
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = 'Agent 2'
+
 if 'session_id' not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    # Resume from a ?session=<id> link when the store knows that session
+    resume_id = st.query_params.get('session')
+    with tracing.span('session_load'):
+        saved = session_store().load(resume_id) if resume_id else None
+    if saved is not None:
+        st.session_state.session_id = resume_id
+        st.session_state.update(saved)
+    else:
+        st.session_state.session_id = str(uuid.uuid4())
+# Keep the resume link in the address bar
+st.query_params['session'] = st.session_state.session_id
+
+# Correlation id for this rerun: sent to n8n as a header and used to name slow traces
+st.session_state.rerun_seq = st.session_state.get('rerun_seq', 0) + 1
+tracing.current().correlation_id = f"{tracing.session_tag(st.session_state.session_id)}-{st.session_state.rerun_seq}"
+
 for key, default in {
     'messages': [],
     'document_texts': [],
@@ -58,11 +103,214 @@ MASTER_WEBHOOK_URL = os.getenv('MASTER_WEBHOOK_URL')
 PILARS_AGENTS_WEBHOOK_URL = os.getenv('PILARS_AGENTS_WEBHOOK_URL')
 PILARS_AGENTS_CHAT_URL = os.getenv('PILARS_AGENTS_CHAT_URL')
 
+# Friendly names for the admin view
+WEBHOOK_NAMES = {
+    N8N_WEBHOOK_URL: 'Miro',
+    ICP_URL: "ICP's",
+    AGENT2_INIT_URL: 'Agent 2 init',
+    AGENT2_CHAT_URL: 'Agent 2 chat',
+    CONTENT_FUNNEL_WEBHOOK_URL: 'Content Funnel',
+    CONVERSION_PATHWAY_WEBHOOK_URL: 'Conversion Pathway',
+    RETENTION_AFFINITY_WEBHOOK_URL: 'Retention + Affinity',
+    STRATEGY_WEBHOOK_URL: 'Strategy',
+    MASTER_WEBHOOK_URL: 'Master',
+    PILARS_AGENTS_WEBHOOK_URL: 'Pilars agents init',
+    PILARS_AGENTS_CHAT_URL: 'Pilars agents chat',
+}
+
+# Caps on how much of a spreadsheet is turned into text
+XLSX_MAX_ROWS  = int(os.getenv('XLSX_MAX_ROWS', '20000'))
+XLSX_MAX_BYTES = int(os.getenv('XLSX_MAX_BYTES', str(5 * 1024 * 1024)))
+# Longest a user is kept waiting in a webhook queue before being told to retry
+WEBHOOK_MAX_QUEUE_WAIT = float(os.getenv('WEBHOOK_MAX_QUEUE_WAIT', '300'))
+
+# -----------------------------
+# Webhook Calls
+# -----------------------------
+def wait_for_webhook(job):
+    # Block until the webhook answers, showing our place in the shared queue meanwhile
+    status = st.empty()
+    deadline = time.monotonic() + WEBHOOK_MAX_QUEUE_WAIT
+    try:
+        with tracing.span('webhook', endpoint=WEBHOOK_NAMES.get(job.ticket.endpoint, job.ticket.endpoint)):
+            while not job.wait(timeout=0.5):
+                position = job.queue_position()
+                if position and time.monotonic() > deadline and job.cancel():
+                    raise WebhookBusy('This service is busy right now, please try again in a few minutes.')
+                if position:
+                    status.info(f"⏳ This service is busy – you are #{position} in the queue")
+                else:
+                    status.empty()
+            return job.result()
+    except WebhookBusy as e:
+        st.warning(f"⏳ {e}")
+        st.stop()
+    finally:
+        status.empty()
+        # Rerun, tab switch or closed page: don't send a request nobody waits for
+        if not job.done():
+            job.cancel()
+
+def extract_while_uploading(job, uploads, progress):
+    # Extract locally while `job` uploads; withdraw the job if the rerun is interrupted
+    try:
+        return extract_documents(uploads, progress)
+    except BaseException:
+        job.cancel()
+        raise
+
+def track_pipeline_job(correlation_id, label):
+    # Remember a workflow that will report back through the callback receiver
+    st.session_state.setdefault('pipeline_jobs', {})[correlation_id] = {
+        'label': label, 'status': 'pending', 'result': None
+    }
+
+def render_pipeline_jobs(jobs):
+    for correlation_id, job in jobs.items():
+        if job['status'] == 'pending':
+            st.info(f"⏳ {job['label']}: n8n is still working...")
+        elif job['status'] == 'expired':
+            st.warning(f"⚠️ {job['label']}: no result was received before the job expired.")
+        else:
+            st.success(f"🎉 {job['label']}: workflow finished!")
+            if job['result']:
+                with st.expander('Result'):
+                    st.write(job['result'])
+
+@st.fragment(run_every=callbacks.CALLBACK_POLL_SECONDS)
+def pipeline_jobs_poller():
+    # Re-runs on its own until every job has reported back, then hands over to a full rerun
+    jobs = st.session_state.pipeline_jobs
+    for correlation_id, job in jobs.items():
+        if job['status'] != 'pending':
+            continue
+        entry = callbacks.registry.get(correlation_id)
+        if entry is None:
+            job['status'] = 'expired'
+        elif entry['done']:
+            job['status'], job['result'] = 'done', entry['result']
+            callbacks.registry.discard(correlation_id)
+    if not any(job['status'] == 'pending' for job in jobs.values()):
+        st.rerun()
+    render_pipeline_jobs(jobs)
+
+def pipeline_jobs_panel():
+    jobs = st.session_state.get('pipeline_jobs')
+    if not jobs:
+        return
+    if any(job['status'] == 'pending' for job in jobs.values()):
+        pipeline_jobs_poller()
+    else:
+        render_pipeline_jobs(jobs)
+        if st.button('Clear finished jobs'):
+            del st.session_state.pipeline_jobs
+            st.rerun()
+
+# -----------------------------
+# Generated Documents
+# -----------------------------
+def pdf_download_button():
+    # Serve the session's generated PDF from the on-disk artifact cache
+    file_name = st.session_state.get('pdf_artifact')
+    if not file_name:
+        return
+    read = artifacts.reader(st.session_state.session_id, file_name)
+    if read is None:
+        st.info('The generated PDF is no longer cached on this server.')
+        return
+    st.success("✅ Document generated successfully!")
+    st.download_button(
+        label="Download PDF",
+        data=read,
+        file_name=file_name,
+        mime="application/pdf",
+        on_click='ignore'
+    )
+
+# -----------------------------
+# Document Ingestion
+# -----------------------------
+def iter_document_pages(data, mime):
+    # Yield (page_no, page_count, text) as each page of a file is extracted
+    if mime == 'application/pdf':
+        pages = PdfReader(io.BytesIO(data)).pages
+        for i, page in enumerate(pages, 1):
+            yield i, len(pages), page.extract_text() or ''
+    elif 'wordprocessingml.document' in mime:
+        yield from iter_docx_blocks(data)
+    elif 'spreadsheetml.sheet' in mime:
+        yield from iter_xlsx_sheets(data)
+    else:
+        yield 1, 1, data.decode(errors='ignore')
+
+def iter_docx_blocks(data):
+    # Walk the document body in order, one paragraph or table at a time
+    doc = Document(io.BytesIO(data))
+    block_count = sum(1 for el in doc.element.body if el.tag.endswith(('}p', '}tbl'))) or 1
+    for i, block in enumerate(doc.iter_inner_content(), 1):
+        if isinstance(block, Table):
+            text = '\n'.join(' | '.join(cell.text for cell in row.cells) for row in block.rows)
+        else:
+            text = block.text
+        yield min(i, block_count), block_count, text
+
+def iter_xlsx_sheets(data):
+    # Stream every sheet row by row in read-only mode, stopping at the row/byte caps
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        # Chartsheets have no rows and are not in wb.worksheets
+        sheet_count = len(wb.worksheets)
+        rows_left, bytes_left = XLSX_MAX_ROWS, XLSX_MAX_BYTES
+        for i, ws in enumerate(wb.worksheets, 1):
+            lines = [f"# Sheet: {ws.title}"]
+            for row in ws.iter_rows(values_only=True):
+                if all(v is None for v in row):
+                    continue
+                buf = io.StringIO()
+                csv.writer(buf, lineterminator='').writerow(['' if v is None else v for v in row])
+                line = buf.getvalue()
+                size = len(line.encode()) + 1
+                if rows_left <= 0 or size > bytes_left:
+                    lines.append('[truncated]')
+                    rows_left = bytes_left = 0
+                    break
+                lines.append(line)
+                rows_left -= 1
+                bytes_left -= size
+            if (rows_left <= 0 or bytes_left <= 0) and i < sheet_count:
+                # The caps stop extraction here, possibly right on a sheet's last row
+                if lines[-1] != '[truncated]':
+                    lines.append('[truncated]')
+                lines.append(f"[{sheet_count - i} more sheet(s) not extracted]")
+                # Reported as the last sheet so the progress bar completes
+                yield sheet_count, sheet_count, '\n'.join(lines)
+                return
+            yield i, sheet_count, '\n'.join(lines)
+    finally:
+        wb.close()
+
+def extract_documents(uploads, progress):
+    # Extract every upload, timed as one span of the rerun trace
+    with tracing.span('extract', files=len(uploads)):
+        return list(iter_documents(uploads, progress))
+
+def iter_documents(uploads, progress):
+    # Yield the full text of each upload as soon as it is extracted, updating the progress bar per page
+    for index, f in enumerate(uploads):
+        pages = []
+        for page_no, page_count, text in iter_document_pages(f.getvalue(), f.type):
+            pages.append(text)
+            progress.progress(
+                (index + page_no / page_count) / len(uploads),
+                text=f"Extracting {f.name} ({page_no}/{page_count})"
+            )
+        yield '\n'.join(pages)
+
 # -----------------------------
 # Sidebar Navigation
 # -----------------------------
 st.sidebar.markdown('<div class="sidebar-header">🤖 DTCMODE BOT-ASSISTANT</div>', unsafe_allow_html=True)
-for tab in ['Miro Sticky Notes', "ICP's", 'Agent 2', 'Content Funnel Section', 'Conversion Pathway Strategy Framework', 'Retention + Affinity Generator', 'Strategy', 'Master', 'Pilars agents']:
+for tab in ['Miro Sticky Notes', "ICP's", 'Agent 2', 'Content Funnel Section', 'Conversion Pathway Strategy Framework', 'Retention + Affinity Generator', 'Strategy', 'Master', 'Pilars agents', 'Admin']:
     if st.sidebar.button(tab):
         st.session_state.active_tab = tab
 
@@ -85,7 +333,7 @@ def miro_mode():
     # 2) File Uploader for Excel
     uploaded_file = st.file_uploader(
         "Upload an Excel (.xlsx) file", type=["xlsx"],
-        help="This file will be sent to n8n for processing"
+        help="Sticky-note positions and colors are computed here; n8n only forwards them to Miro"
     )
     if not uploaded_file:
         st.stop()
@@ -100,35 +348,66 @@ def miro_mode():
         st.error(f"Error reading Excel file: {e}")
         st.stop()
 
-    # 4) Build the n8n Webhook URL and Miro Bulk-Create URL
+    # 4) Layout options
+    columns = list(df.columns)
+    text_column = st.selectbox("Sticky-note text column", columns)
+    group_column = st.selectbox(
+        "Group notes by", [None] + columns,
+        format_func=lambda c: "No grouping (single grid)" if c is None else c,
+        help="Each group becomes its own labelled cluster with its own color"
+    )
+
+    # 5) Dry run: compute the layout and bulk batches locally and preview them
+    with tracing.span('miro_layout', rows=len(df)):
+        notes, labels = miro_layout.compute_layout(df, text_column, group_column)
+        items = miro_layout.bulk_items(notes, labels if group_column else None)
+        batches = miro_layout.batches(items)
+    if notes.empty:
+        st.warning(f"No text found in column '{text_column}'.")
+        st.stop()
+
+    st.write("### Dry-run preview")
+    st.caption(
+        f"{len(notes)} sticky notes in {max(len(labels), 1)} cluster(s) – "
+        f"{len(batches)} bulk requests of up to {miro_layout.MIRO_BATCH_SIZE} items"
+    )
+    preview = notes.assign(
+        y=-notes['y'],  # Miro's y axis points down
+        fill=notes['color'].map(miro_layout.FILL_COLORS)
+    )
+    st.scatter_chart(preview, x='x', y='y', color='fill', size=60)
+    with st.expander("First bulk request"):
+        st.json(batches[0])
+
+    # 6) Build the n8n Webhook URL and Miro Bulk-Create URL
     N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
     if not N8N_WEBHOOK_URL:
         st.error("❌ Missing N8N_WEBHOOK_URL in the environment variables.")
         st.stop()
 
-    st.write(f"▶️ Posting file + board_id to n8n webhook: `{N8N_WEBHOOK_URL}`")
-
     # Encode board_id for URL safety
     from urllib.parse import quote
     encoded_board_id = quote(board_id, safe='')
     miro_url = f"https://api.miro.com/v2/boards/{encoded_board_id}/items/bulk"
     st.write(f"▶️ Miro Bulk-Create API URL: `{miro_url}`")
 
-    # 5) Send the File + board_id + miro_url to n8n
+    if not st.button("Send to Miro"):
+        st.stop()
+
+    # 7) Send the ready-to-post batches; n8n forwards each one to miro_url
+    st.write(f"▶️ Posting {len(batches)} batches to n8n webhook: `{N8N_WEBHOOK_URL}`")
     with st.spinner("Triggering workflow in n8n..."):
-        files = {
-            'data': (
-                uploaded_file.name,
-                uploaded_file.getvalue(),
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        }
-        data = {
+        payload = {
             'board_id': board_id,
-            'miro_url': miro_url
+            'miro_url': miro_url,
+            'file_name': uploaded_file.name,
+            'batches': batches
         }
         try:
-            resp = requests.post(N8N_WEBHOOK_URL, files=files, data=data, timeout=180)
+            resp = wait_for_webhook(submit_webhook(
+                N8N_WEBHOOK_URL, st.session_state.session_id,
+                json=payload
+            ))
             if resp.ok:
                 st.success("🎉 Workflow triggered successfully!")
             else:
@@ -153,23 +432,15 @@ def icp_mode():
     )
 
     if uploads:
-        # Validate file types and count
-        pdf_files = [f for f in uploads if f.type == 'application/pdf']
-        txt_files = [f for f in uploads if f.type == 'text/plain']
-
-        # Display validation messages
-        st.write(f"📄 PDF files uploaded: {len(pdf_files)}")
-        st.write(f"📝 TXT files uploaded: {len(txt_files)}")
-
-        if len(txt_files) > 3:
-            st.warning('⚠️ Please upload no more than 3 TXT files.')
-            return
-
-        # Check total size limit (50 MB)
-        total_size = sum(f.size for f in uploads)
-        if total_size > 50 * 1024 * 1024:
-            total_size_mb = total_size / (1024 * 1024)
-            st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+        # Count file types the same way the batch runner does (by file name)
+        types = [pipelines.file_type(f.name) for f in uploads]
+        st.write(f"📄 PDF files uploaded: {types.count('application/pdf')}")
+        st.write(f"📝 TXT files uploaded: {types.count('text/plain')}")
+
+        # Check the TXT file count and total size limit (50 MB)
+        error = pipelines.upload_error([(f.name, f.size) for f in uploads], pipelines.MAX_TXT_FILES)
+        if error:
+            st.error(error)
             return
 
         # Button to send files to webhook
@@ -181,22 +452,22 @@ def icp_mode():
             with st.spinner("Processing files..."):
                 try:
                     # Prepare the file payload
-                    files_payload = []
-                    for f in uploads:
-                        data = f.read()
-                        file_type = 'application/pdf' if f.type == 'application/pdf' else 'text/plain'
-                        files_payload.append(('files', (f.name, data, file_type)))
+                    files_payload = pipelines.files_payload([(f.name, f.read()) for f in uploads])
 
                     # Prepare additional data
                     data = {
                         'email': email
                     }
+                    correlation_id = callbacks.attach(data)
 
                     # Send the files to the webhook
-                    resp = requests.post(ICP_URL, files=files_payload, data=data, timeout=180)
+                    resp = wait_for_webhook(submit_webhook(ICP_URL, email, files=files_payload, data=data))
 
                     # Handle the response
-                    if resp.ok:
+                    if resp.ok and correlation_id:
+                        track_pipeline_job(correlation_id, "ICP's")
+                        st.success("📨 Files submitted – the result will appear above when n8n finishes.")
+                    elif resp.ok:
                         st.success("🎉 Files processed successfully!")
                     else:
                         st.error(f"❌ Error: {resp.status_code} - {resp.text}")
@@ -206,6 +477,44 @@ def icp_mode():
 # -----------------------------
 # Agent 2: File Upload & Chat Assistant
 # -----------------------------
+def summary_payload(result_json):
+    # The summary object n8n sent, or None when the result has another shape
+    payload = result_json[0] if isinstance(result_json, list) and result_json else result_json
+    return payload if isinstance(payload, dict) else None
+
+def store_agent2_summary(payload):
+    summary = payload.get('summary') or payload.get('assistant') or payload.get('textContent','')
+    summary = summary.strip()
+
+    # Store and display
+    st.session_state.brand_summary = summary
+    st.session_state.messages.append({
+        'role': 'assistant',
+        'content': summary,
+        'email': st.session_state.agent2_email  # Include email in message
+    })
+
+@st.fragment(run_every=callbacks.CALLBACK_POLL_SECONDS)
+def agent2_init_poller():
+    # Poll the callback receiver until n8n posts the initial summary
+    correlation_id = st.session_state.agent2_init_job
+    entry = callbacks.registry.get(correlation_id)
+    if entry is None:
+        del st.session_state.agent2_init_job
+        st.session_state.agent2_init_error = 'No summary was received from n8n before the job expired. Please try again.'
+        st.rerun()
+    if not entry['done']:
+        st.info('⏳ n8n is generating the initial summary...')
+        return
+    payload = summary_payload(entry['result'])
+    callbacks.registry.discard(correlation_id)
+    del st.session_state.agent2_init_job
+    if payload is None:
+        st.session_state.agent2_init_error = 'n8n sent back an initial summary in an unexpected format. Please try again.'
+    else:
+        store_agent2_summary(payload)
+    st.rerun()
+
 def agent2_mode():
     st.header('Agent 2 – File Upload & Chat Assistant')
 
@@ -218,12 +527,15 @@ def agent2_mode():
     if email != st.session_state.agent2_email:
         st.session_state.agent2_email = email
 
+    if 'agent2_init_error' in st.session_state:
+        st.error(f"❌ {st.session_state.pop('agent2_init_error')}")
+
     # --- File Upload & Initial Summary ---
-    if not st.session_state.brand_summary:
+    if not st.session_state.brand_summary and not st.session_state.get('agent2_init_job'):
         with st.form('upload_form', clear_on_submit=True):
             uploads = st.file_uploader(
-                'Upload files(BRAND DOCUMENT AS PDF AND MEETING NOTES AS TXT)', 
-                type=['pdf','txt'],
+                'Upload files(BRAND DOCUMENT AS PDF, DOCX OR XLSX AND MEETING NOTES AS TXT)', 
+                type=['pdf','txt','docx','xlsx'],
                 accept_multiple_files=True
             )
             submitted = st.form_submit_button('Get Initial Summary')
@@ -232,45 +544,40 @@ def agent2_mode():
             if not uploads or not st.session_state.agent2_email.strip():
                 st.warning('Please upload files and enter email')
             else:
-                docs, files_payload = [], []
-                for f in uploads:
-                    data = f.read()
-                    if f.type == 'application/pdf':
-                        txt = '\n'.join(p.extract_text() or '' for p in PdfReader(io.BytesIO(data)).pages)
-                    elif 'wordprocessingml.document' in f.type:
-                        doc = Document(io.BytesIO(data))
-                        txt = '\n'.join(p.text for p in doc.paragraphs)
-                    elif 'spreadsheetml.sheet' in f.type:
-                        df = pd.read_excel(io.BytesIO(data))
-                        txt = df.to_csv(index=False)
-                    else:
-                        txt = data.decode(errors='ignore')
-                    docs.append(txt)
-                    files_payload.append(('files', (f.name, data, f.type)))
-
-                st.session_state.document_texts = docs
-
-                # Call initial-summary webhook with email
-                resp = requests.post(
+                # Start the upload right away so n8n works while we extract text locally
+                files_payload = [('files', (f.name, f.getvalue(), f.type)) for f in uploads]
+                init_data = {'email': st.session_state.agent2_email}
+                correlation_id = callbacks.attach(init_data)
+                job = submit_webhook(
                     AGENT2_INIT_URL,
+                    st.session_state.agent2_email,
                     files=files_payload,
-                    data={'email': st.session_state.agent2_email},
-                    timeout=180
+                    data=init_data
                 )
+
+                progress = st.progress(0.0, text='Extracting documents...')
+                st.session_state.document_texts = extract_while_uploading(job, uploads, progress)
+                progress.empty()
+
+                # Wait for the initial-summary webhook
+                with st.spinner('Waiting for initial summary...'):
+                    resp = wait_for_webhook(job)
                 resp.raise_for_status()
-                result_json = resp.json()
-                payload = result_json[0] if isinstance(result_json, list) else result_json
-                summary = payload.get('summary') or payload.get('assistant') or payload.get('textContent','')
-                summary = summary.strip()
+                if correlation_id:
+                    # n8n accepted the job; the summary arrives on the callback
+                    st.session_state.agent2_init_job = correlation_id
+                    st.rerun()
+                with tracing.span('parse'):
+                    payload = summary_payload(resp.json())
+                if payload is None:
+                    st.error('❌ n8n sent back an initial summary in an unexpected format. Please try again.')
+                else:
+                    store_agent2_summary(payload)
+                    st.success('Initial summary generated!')
 
-                # Store and display
-                st.session_state.brand_summary = summary
-                st.session_state.messages.append({
-                    'role': 'assistant',
-                    'content': summary,
-                    'email': st.session_state.agent2_email  # Include email in message
-                })
-                st.success('Initial summary generated!')
+    # --- Waiting for an asynchronous initial summary ---
+    if st.session_state.get('agent2_init_job'):
+        agent2_init_poller()
 
     # --- Display Initial Summary ---
     if st.session_state.brand_summary:
@@ -280,9 +587,10 @@ def agent2_mode():
     # --- Chat Interface ---
     st.markdown('---')
     st.subheader('Chat')
-    for msg in st.session_state.messages:
-        with st.chat_message(msg['role']):
-            st.markdown(msg['content'])
+    with tracing.span('render_messages', messages=len(st.session_state.messages)):
+        for msg in st.session_state.messages:
+            with st.chat_message(msg['role']):
+                st.markdown(msg['content'])
 
     # --- Chat Input & Response ---
     if st.session_state.brand_summary and not st.session_state.approved:
@@ -308,8 +616,8 @@ def agent2_mode():
             
             try:
                 with st.spinner("Waiting for response from the assistant..."):
-                    # Increased timeout to 180 seconds
-                    resp = requests.post(AGENT2_CHAT_URL, json=payload, timeout=180)
+                    job = submit_webhook(AGENT2_CHAT_URL, st.session_state.agent2_email, json=payload, stream=True)
+                    resp = wait_for_webhook(job)
                     
                     if not resp.ok:
                         st.error(f"Server returned error {resp.status_code}: {resp.text}")
@@ -319,24 +627,19 @@ def agent2_mode():
                     content_type = resp.headers.get('content-type', '')
                     
                     if 'application/pdf' in content_type:
-                        # Handle PDF response
-                        st.success("✅ Document generated successfully!")
-                        
-                        # Create download button for PDF
-                        st.download_button(
-                            label="Download PDF",
-                            data=resp.content,
-                            file_name=f"generated_document_{st.session_state.session_id}.pdf",
-                            mime="application/pdf"
-                        )
-                        
-                        # Set approved state
+                        # Spool the PDF to the session's artifact cache instead of keeping it in memory
+                        file_name = f"generated_document_{st.session_state.session_id}.pdf"
+                        artifacts.save_response(st.session_state.session_id, file_name, resp)
+                        st.session_state.pdf_artifact = file_name
+
+                        # Set approved state; the download button is rendered from the cache on every rerun
                         st.session_state.approved = True
-                        return
+                        st.rerun()
                         
                     # Handle JSON/text responses as before
                     try:
-                        data = resp.json()
+                        with tracing.span('parse'):
+                            data = resp.json()
                         data = data[0] if isinstance(data, list) else data
                         # Ensure email is preserved in the response data
                         if 'email' not in data:
@@ -351,8 +654,8 @@ def agent2_mode():
                         }
                     
             except requests.exceptions.ReadTimeout:
-                st.error("""
-                Request timed out after 180 seconds. This could be because:
+                st.error(f"""
+                Request timed out after {job.timeout[1]:.0f} seconds. This could be because:
                 1. The server is taking too long to process
                 2. There might be an issue with the webhook response configuration
                 
@@ -389,6 +692,7 @@ def agent2_mode():
     # --- Final Summary on approval ---
     elif st.session_state.approved:
         st.success('✅ Conversation approved!')
+        pdf_download_button()
         st.markdown(f"""### Final Summary
 {st.session_state.brand_summary}""")
 
@@ -415,20 +719,15 @@ def content_funnel_mode():
             return
 
         # Check total size limit (50 MB)
-        total_size = sum(f.size for f in uploads)
-        if total_size > 50 * 1024 * 1024:
-            total_size_mb = total_size / (1024 * 1024)
-            st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+        error = pipelines.upload_error([(f.name, f.size) for f in uploads])
+        if error:
+            st.error(error)
             return
 
         with st.spinner("Sending files to n8n webhook..."):
             try:
                 # Prepare the file payload
-                files_payload = []
-                for f in uploads:
-                    data = f.read()
-                    file_type = 'application/pdf' if f.name.endswith('.pdf') else 'text/plain'
-                    files_payload.append(('files', (f.name, data, file_type)))
+                files_payload = pipelines.files_payload([(f.name, f.read()) for f in uploads])
 
                 # Prepare additional data
                 data = {
@@ -436,7 +735,9 @@ def content_funnel_mode():
                 }
 
                 # Send the files to the n8n webhook
-                resp = requests.post(CONTENT_FUNNEL_WEBHOOK_URL, files=files_payload, data=data, timeout=180)
+                resp = wait_for_webhook(submit_webhook(
+                    CONTENT_FUNNEL_WEBHOOK_URL, email, files=files_payload, data=data
+                ))
 
                 # Handle the response
                 if resp.ok:
@@ -469,20 +770,15 @@ def conversion_pathway_mode():
             return
 
         # Check total size limit (50 MB)
-        total_size = sum(f.size for f in uploads)
-        if total_size > 50 * 1024 * 1024:
-            total_size_mb = total_size / (1024 * 1024)
-            st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+        error = pipelines.upload_error([(f.name, f.size) for f in uploads])
+        if error:
+            st.error(error)
             return
 
         with st.spinner("Sending files to n8n webhook..."):
             try:
                 # Prepare the file payload
-                files_payload = []
-                for f in uploads:
-                    data = f.read()
-                    file_type = 'application/pdf' if f.name.endswith('.pdf') else 'text/plain'
-                    files_payload.append(('files', (f.name, data, file_type)))
+                files_payload = pipelines.files_payload([(f.name, f.read()) for f in uploads])
 
                 # Prepare additional data
                 data = {
@@ -490,7 +786,9 @@ def conversion_pathway_mode():
                 }
 
                 # Send the files to the n8n webhook
-                resp = requests.post(CONVERSION_PATHWAY_WEBHOOK_URL, files=files_payload, data=data, timeout=180)
+                resp = wait_for_webhook(submit_webhook(
+                    CONVERSION_PATHWAY_WEBHOOK_URL, email, files=files_payload, data=data
+                ))
 
                 # Handle the response
                 if resp.ok:
@@ -523,20 +821,15 @@ def retention_affinity_mode():
             return
 
         # Check total size limit (50 MB)
-        total_size = sum(f.size for f in uploads)
-        if total_size > 50 * 1024 * 1024:
-            total_size_mb = total_size / (1024 * 1024)
-            st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+        error = pipelines.upload_error([(f.name, f.size) for f in uploads])
+        if error:
+            st.error(error)
             return
 
         with st.spinner("Sending files to n8n webhook..."):
             try:
                 # Prepare the file payload
-                files_payload = []
-                for f in uploads:
-                    data = f.read()
-                    file_type = 'application/pdf' if f.name.endswith('.pdf') else 'text/plain'
-                    files_payload.append(('files', (f.name, data, file_type)))
+                files_payload = pipelines.files_payload([(f.name, f.read()) for f in uploads])
 
                 # Prepare additional data
                 data = {
@@ -544,7 +837,9 @@ def retention_affinity_mode():
                 }
 
                 # Send the files to the n8n webhook
-                resp = requests.post(RETENTION_AFFINITY_WEBHOOK_URL, files=files_payload, data=data, timeout=180)
+                resp = wait_for_webhook(submit_webhook(
+                    RETENTION_AFFINITY_WEBHOOK_URL, email, files=files_payload, data=data
+                ))
 
                 # Handle the response
                 if resp.ok:
@@ -577,31 +872,32 @@ def strategy_mode():
             return
 
         # Check total size limit (50 MB)
-        total_size = sum(f.size for f in uploads)
-        if total_size > 50 * 1024 * 1024:
-            total_size_mb = total_size / (1024 * 1024)
-            st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+        error = pipelines.upload_error([(f.name, f.size) for f in uploads])
+        if error:
+            st.error(error)
             return
 
         with st.spinner("Sending files to n8n webhook..."):
             try:
                 # Prepare the file payload
-                files_payload = []
-                for f in uploads:
-                    data = f.read()
-                    file_type = 'application/pdf' if f.name.endswith('.pdf') else 'text/plain'
-                    files_payload.append(('files', (f.name, data, file_type)))
+                files_payload = pipelines.files_payload([(f.name, f.read()) for f in uploads])
 
                 # Prepare additional data
                 data = {
                     'email': email  # Include the email in the payload
                 }
+                correlation_id = callbacks.attach(data)
 
                 # Send the files to the n8n webhook
-                resp = requests.post(STRATEGY_WEBHOOK_URL, files=files_payload, data=data, timeout=180)
+                resp = wait_for_webhook(submit_webhook(
+                    STRATEGY_WEBHOOK_URL, email, files=files_payload, data=data
+                ))
 
                 # Handle the response
-                if resp.ok:
+                if resp.ok and correlation_id:
+                    track_pipeline_job(correlation_id, 'Strategy')
+                    st.success("📨 Files submitted – the result will appear above when n8n finishes.")
+                elif resp.ok:
                     st.success("🎉 Files sent to n8n webhook successfully!")
                 else:
                     st.error(f"❌ n8n webhook returned {resp.status_code}: {resp.text}")
@@ -631,31 +927,32 @@ def master_mode():
             return
 
         # Check total size limit (50 MB)
-        total_size = sum(f.size for f in uploads)
-        if total_size > 50 * 1024 * 1024:
-            total_size_mb = total_size / (1024 * 1024)
-            st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+        error = pipelines.upload_error([(f.name, f.size) for f in uploads])
+        if error:
+            st.error(error)
             return
 
         with st.spinner("Sending files to n8n webhook..."):
             try:
                 # Prepare the file payload
-                files_payload = []
-                for f in uploads:
-                    data = f.read()
-                    file_type = 'application/pdf' if f.name.endswith('.pdf') else 'text/plain'
-                    files_payload.append(('files', (f.name, data, file_type)))
+                files_payload = pipelines.files_payload([(f.name, f.read()) for f in uploads])
 
                 # Prepare additional data
                 data = {
                     'email': email  # Include the email in the payload
                 }
+                correlation_id = callbacks.attach(data)
 
                 # Send the files to the n8n webhook
-                resp = requests.post(MASTER_WEBHOOK_URL, files=files_payload, data=data, timeout=180)
+                resp = wait_for_webhook(submit_webhook(
+                    MASTER_WEBHOOK_URL, email, files=files_payload, data=data
+                ))
 
                 # Handle the response
-                if resp.ok:
+                if resp.ok and correlation_id:
+                    track_pipeline_job(correlation_id, 'Master')
+                    st.success("📨 Files submitted – the result will appear above when n8n finishes.")
+                elif resp.ok:
                     st.success("🎉 Files sent to n8n webhook successfully!")
                 else:
                     st.error(f"❌ n8n webhook returned {resp.status_code}: {resp.text}")
@@ -708,43 +1005,37 @@ def pilars_agents_mode():
                 return
 
             # Check total size limit (50 MB)
-            total_size = sum(f.size for f in (pdf_uploads + txt_uploads))
-            if total_size > 50 * 1024 * 1024:
-                total_size_mb = total_size / (1024 * 1024)
-                st.error(f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit.")
+            error = pipelines.upload_error([(f.name, f.size) for f in pdf_uploads + txt_uploads])
+            if error:
+                st.error(error)
                 return
 
-            docs, files_payload = [], []
-            # Process PDF files
-            for f in pdf_uploads:
-                data = f.read()
-                txt = '\n'.join(p.extract_text() or '' for p in PdfReader(io.BytesIO(data)).pages)
-                docs.append(txt)
-                files_payload.append(('files', (f.name, data, 'application/pdf')))
-
-            # Process TXT files
-            for f in txt_uploads:
-                data = f.read()
-                txt = data.decode(errors='ignore')
-                docs.append(txt)
-                files_payload.append(('files', (f.name, data, 'text/plain')))
+            uploads = pdf_uploads + txt_uploads
+
+            # Start the upload right away so n8n works while we extract text locally
+            files_payload = [('files', (f.name, f.getvalue(), f.type)) for f in uploads]
+            job = submit_webhook(
+                PILARS_AGENTS_WEBHOOK_URL,
+                st.session_state.pilars_email,
+                files=files_payload,
+                data={
+                    'email': st.session_state.pilars_email,
+                    'pdf_count': len(pdf_uploads),
+                    'txt_count': len(txt_uploads)
+                }
+            )
 
-            st.session_state.document_texts = docs
+            progress = st.progress(0.0, text='Extracting documents...')
+            st.session_state.document_texts = extract_while_uploading(job, uploads, progress)
+            progress.empty()
 
-            # Call initial webhook with files and email
+            # Wait for the initial webhook
             try:
-                resp = requests.post(
-                    PILARS_AGENTS_WEBHOOK_URL,
-                    files=files_payload,
-                    data={
-                        'email': st.session_state.pilars_email,
-                        'pdf_count': len(pdf_uploads),
-                        'txt_count': len(txt_uploads)
-                    },
-                    timeout=180
-                )
+                with st.spinner('Waiting for initial processing...'):
+                    resp = wait_for_webhook(job)
                 resp.raise_for_status()
-                result_json = resp.json()
+                with tracing.span('parse'):
+                    result_json = resp.json()
                 payload = result_json[0] if isinstance(result_json, list) else result_json
                 summary = payload.get('summary') or payload.get('assistant') or payload.get('textContent','')
                 summary = summary.strip()
@@ -769,9 +1060,10 @@ def pilars_agents_mode():
     # --- Chat Interface ---
     st.markdown('---')
     st.subheader('Chat')
-    for msg in st.session_state.messages:
-        with st.chat_message(msg['role']):
-            st.markdown(msg['content'])
+    with tracing.span('render_messages', messages=len(st.session_state.messages)):
+        for msg in st.session_state.messages:
+            with st.chat_message(msg['role']):
+                st.markdown(msg['content'])
 
     # --- Chat Input & Response ---
     if st.session_state.brand_summary and not st.session_state.approved:
@@ -797,7 +1089,8 @@ def pilars_agents_mode():
             
             try:
                 with st.spinner("Waiting for response from the assistant..."):
-                    resp = requests.post(PILARS_AGENTS_CHAT_URL, json=payload, timeout=180)
+                    job = submit_webhook(PILARS_AGENTS_CHAT_URL, st.session_state.pilars_email, json=payload, stream=True)
+                    resp = wait_for_webhook(job)
                     
                     if not resp.ok:
                         st.error(f"Server returned error {resp.status_code}: {resp.text}")
@@ -807,24 +1100,19 @@ def pilars_agents_mode():
                     content_type = resp.headers.get('content-type', '')
                     
                     if 'application/pdf' in content_type:
-                        # Handle PDF response
-                        st.success("✅ Document generated successfully!")
-                        
-                        # Create download button for PDF
-                        st.download_button(
-                            label="Download PDF",
-                            data=resp.content,
-                            file_name=f"pilars_document_{st.session_state.session_id}.pdf",
-                            mime="application/pdf"
-                        )
-                        
-                        # Set approved state
+                        # Spool the PDF to the session's artifact cache instead of keeping it in memory
+                        file_name = f"pilars_document_{st.session_state.session_id}.pdf"
+                        artifacts.save_response(st.session_state.session_id, file_name, resp)
+                        st.session_state.pdf_artifact = file_name
+
+                        # Set approved state; the download button is rendered from the cache on every rerun
                         st.session_state.approved = True
-                        return
+                        st.rerun()
                         
                     # Handle JSON/text responses
                     try:
-                        data = resp.json()
+                        with tracing.span('parse'):
+                            data = resp.json()
                         data = data[0] if isinstance(data, list) else data
                         if 'email' not in data:
                             data['email'] = st.session_state.pilars_email
@@ -837,8 +1125,8 @@ def pilars_agents_mode():
                         }
                     
             except requests.exceptions.ReadTimeout:
-                st.error("""
-                Request timed out after 180 seconds. This could be because:
+                st.error(f"""
+                Request timed out after {job.timeout[1]:.0f} seconds. This could be because:
                 1. The server is taking too long to process
                 2. There might be an issue with the webhook response configuration
                 
@@ -875,27 +1163,133 @@ def pilars_agents_mode():
     # --- Final Summary on approval ---
     elif st.session_state.approved:
         st.success('✅ Conversation approved!')
+        pdf_download_button()
         st.markdown(f"""### Final Summary
 {st.session_state.brand_summary}""")
 
+# -----------------------------
+# Admin
+# -----------------------------
+ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
+
+def admin_unlocked():
+    # The Admin tab exposes process-wide data, so it needs ADMIN_PASSWORD
+    if st.session_state.get('admin_unlocked'):
+        return True
+    if not ADMIN_PASSWORD:
+        st.info('The Admin tab is disabled. Set ADMIN_PASSWORD in the environment to enable it.')
+        return False
+    password = st.text_input('Admin password', type='password')
+    if password and hmac.compare_digest(password.encode(), ADMIN_PASSWORD.encode()):
+        st.session_state.admin_unlocked = True
+        return True
+    if password:
+        st.error('❌ Wrong password.')
+    return False
+
+def admin_mode():
+    st.header('Admin')
+    if not admin_unlocked():
+        return
+
+    if callbacks.enabled():
+        if callbacks.start_receiver():
+            st.success(f"Callback receiver is answering on port {callbacks.CALLBACK_PORT}.")
+        else:
+            st.error(f"Callback receiver could not bind port {callbacks.CALLBACK_PORT} and no other worker answers there; long workflows fall back to synchronous calls.")
+
+    # Live timeouts derived from each endpoint's latency history
+    st.subheader('Webhook timeouts')
+    timeouts = latency.stats()
+    if timeouts:
+        df = pd.DataFrame.from_dict(timeouts, orient='index')
+        df.index = [WEBHOOK_NAMES.get(url, url) for url in df.index]
+        st.dataframe(df.round(2))
+    else:
+        st.info('No webhook calls recorded in this process yet.')
+
+    # Current load on the shared per-endpoint queues
+    st.subheader('Webhook queues')
+    queues = admission.stats()
+    if queues:
+        df = pd.DataFrame.from_dict(queues, orient='index')
+        df.index = [WEBHOOK_NAMES.get(url, url) for url in df.index]
+        st.dataframe(df)
+    else:
+        st.info('No webhook queues active in this process yet.')
+
+    # Reruns that took longer than TRACE_SLOW_RERUN_SECONDS, with a profile when sampled
+    st.subheader('Slow reruns')
+    traces = tracing.list_traces()
+    if traces:
+        st.dataframe(pd.DataFrame([
+            {
+                'trace': t['trace_id'],
+                'tab': t.get('tab'),
+                'total_s': t['total_s'],
+                'slowest span': max(t['spans'], key=lambda s: s['duration_s'])['name'] if t['spans'] else None,
+            }
+            for t in traces
+        ]).set_index('trace'))
+        trace = st.selectbox('Inspect trace', traces, format_func=lambda t: f"{t['trace_id']} ({t['total_s']:.1f}s)")
+        st.caption(f"Correlation ID: `{trace['correlation_id']}` – matches the {tracing.CORRELATION_HEADER} header n8n received")
+        if trace['spans']:
+            st.dataframe(pd.DataFrame(trace['spans']).set_index('name'))
+        report = tracing.profile_report(trace['trace_id'])
+        if report:
+            with st.expander('cProfile (top 40 by cumulative time)'):
+                st.code(report)
+    else:
+        st.info(f"No reruns slower than {tracing.TRACE_SLOW_RERUN_SECONDS:g}s recorded yet.")
+
+    if st.button('Refresh'):
+        st.rerun()
+
+# -----------------------------
+# Session Persistence
+# -----------------------------
+def persist_session():
+    # Write the conversation back to the shared store only when it changed;
+    # a digest is kept instead of a second copy of the (possibly large) state
+    state = snapshot(st.session_state)
+    digest = hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+    if digest == st.session_state.get('persisted_digest'):
+        return
+    if 'persisted_digest' not in st.session_state and not any(state.values()):
+        # Untouched default state of a visitor who never did anything
+        return
+    session_store().save(st.session_state.session_id, state)
+    st.session_state.persisted_digest = digest
+
 # -----------------------------
 # Main Dispatcher
 # -----------------------------
-if st.session_state.active_tab == 'Miro Sticky Notes':
-    miro_mode()
-elif st.session_state.active_tab == "ICP's":
-    icp_mode()
-elif st.session_state.active_tab == "Content Funnel Section":
-    content_funnel_mode()
-elif st.session_state.active_tab == "Conversion Pathway Strategy Framework":
-    conversion_pathway_mode()
-elif st.session_state.active_tab == "Retention + Affinity Generator":
-    retention_affinity_mode()
-elif st.session_state.active_tab == "Strategy":
-    strategy_mode()
-elif st.session_state.active_tab == "Master":
-    master_mode()
-elif st.session_state.active_tab == "Pilars agents":
-    pilars_agents_mode()
-else:
-    agent2_mode()
+try:
+    # Results of workflows that complete through the callback receiver
+    pipeline_jobs_panel()
+
+    if st.session_state.active_tab == 'Miro Sticky Notes':
+        miro_mode()
+    elif st.session_state.active_tab == "ICP's":
+        icp_mode()
+    elif st.session_state.active_tab == "Content Funnel Section":
+        content_funnel_mode()
+    elif st.session_state.active_tab == "Conversion Pathway Strategy Framework":
+        conversion_pathway_mode()
+    elif st.session_state.active_tab == "Retention + Affinity Generator":
+        retention_affinity_mode()
+    elif st.session_state.active_tab == "Strategy":
+        strategy_mode()
+    elif st.session_state.active_tab == "Master":
+        master_mode()
+    elif st.session_state.active_tab == "Pilars agents":
+        pilars_agents_mode()
+    elif st.session_state.active_tab == "Admin":
+        admin_mode()
+    else:
+        agent2_mode()
+finally:
+    # Runs on st.stop() / early returns too, so every rerun is saved and traced
+    with tracing.span('persist'):
+        persist_session()
+    tracing.finish(tab=st.session_state.active_tab)
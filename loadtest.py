@@ -0,0 +1,520 @@
+"""Load-test fro.py with many concurrent sessions against a stub n8n backend.
+
+The harness starts `streamlit run fro.py` with every webhook pointed at a
+local stub n8n that answers after a configurable delay, then opens N
+simulated browser sessions over Streamlit's websocket protocol. Sessions
+cycle through the Agent 2 flow (upload + chat turns), the Pilars agents flow
+and pipeline submissions. The run is split into steps with increasing session
+counts; each step reports throughput, latency percentiles, error rate and the
+server's RSS growth so the scaling knee shows up before production finds it.
+
+    python loadtest.py --steps 1,4,8,16,32 --step-seconds 60 --stub-latency 0.5
+    python loadtest.py --stub-only --stub-port 18080   # just serve the stub n8n
+    python loadtest.py --app-url http://localhost:8501 --app-pid 1234
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import uuid
+import argparse
+import contextlib
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from PyPDF2 import PdfWriter
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fro.py')
+
+# -----------------------------
+# Stub n8n
+# -----------------------------
+# webhook env var -> stub path
+STUB_ROUTES = {
+    'AGENT2_WEBHOOK_URL': '/agent2/init',
+    'AGENT2_CHATBOT_URL': '/agent2/chat',
+    'PILARS_AGENTS_WEBHOOK_URL': '/pilars/init',
+    'PILARS_AGENTS_CHAT_URL': '/pilars/chat',
+    'ICP_WEBHOOK_URL': '/pipeline/icp',
+    'CONTENT_FUNNEL_WEBHOOK_URL': '/pipeline/content_funnel',
+    'CONVERSION_PATHWAY_WEBHOOK_URL': '/pipeline/conversion_pathway',
+    'RETENTION_AFFINITY_WEBHOOK_URL': '/pipeline/retention_affinity',
+    'STRATEGY_WEBHOOK_URL': '/pipeline/strategy',
+    'MASTER_WEBHOOK_URL': '/pipeline/master',
+}
+
+
+class StubN8nHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+
+        if random.random() < server.error_rate:
+            body, status = {'error': 'simulated n8n failure'}, 500
+        elif self.path.endswith('/init'):
+            body, status = {'summary': 'Simulated brand summary.'}, 200
+        elif self.path.endswith('/chat'):
+            body, status = {'assistant': 'Simulated reply.', 'generated_summary': 'Simulated brand summary.'}, 200
+        else:
+            body, status = {'status': 'accepted'}, 200
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host, port, latency, jitter, error_rate):
+    server = ThreadingHTTPServer((host, port), StubN8nHandler)
+    server.daemon_threads = True
+    server.latency, server.jitter, server.error_rate = latency, jitter, error_rate
+    threading.Thread(target=server.serve_forever, name='stub-n8n', daemon=True).start()
+    return server
+
+
+# -----------------------------
+# Metrics
+# -----------------------------
+def rss_bytes(pid):
+    # Resident set size of the app server process, or None if it can't be read (non-Linux)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (finished at, operation, seconds, ok)
+        self.samples = []
+
+    def record(self, op, seconds, ok):
+        with self.lock:
+            self.samples.append((time.monotonic(), op, seconds, ok))
+
+
+def timed(recorder, op, action):
+    # Run one Streamlit rerun and record how long it took and whether it failed
+    started = time.monotonic()
+    try:
+        errors = action()
+    except Exception as e:
+        errors = [f"{type(e).__name__}: {e}"]
+    recorder.record(op, time.monotonic() - started, not errors)
+    return not errors
+
+
+# -----------------------------
+# Streamlit Client
+# -----------------------------
+# Speaks the same websocket protocol as the browser: BackMsg protobufs go up,
+# ForwardMsg deltas come back, and uploads are PUT to /_stcore/upload_file.
+
+class StreamlitSession:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.http = requests.Session()
+        # Picks up the XSRF cookie when the server has XSRF protection enabled
+        self.http.get(f"{base_url}/_stcore/health", timeout=timeout).raise_for_status()
+        self.xsrf = self.http.cookies.get('_streamlit_xsrf')
+
+        subprotocols = ['streamlit'] + ([self.xsrf] if self.xsrf else [])
+        headers = {'Cookie': f"_streamlit_xsrf={self.xsrf}"} if self.xsrf else {}
+        self.stack = contextlib.ExitStack()
+        self.ws = self.stack.enter_context(connect(
+            base_url.replace('http', 'ws', 1) + '/_stcore/stream',
+            subprotocols=subprotocols,
+            additional_headers=headers,
+            max_size=None,
+            open_timeout=timeout,
+        ))
+        self.session_id = None
+        self.query_string = ''
+        self.page_script_hash = ''
+        # (element type, label) -> widget id, as rendered by the latest run
+        self.widgets = {}
+        # widget id -> WidgetState the "browser" keeps sending on every rerun
+        self.values = {}
+
+    def close(self):
+        self.stack.close()
+
+    def _receive(self):
+        msg = ForwardMsg()
+        msg.ParseFromString(self.ws.recv(timeout=self.timeout))
+        kind = msg.WhichOneof('type')
+        if kind == 'new_session':
+            self.session_id = msg.new_session.initialize.session_id
+            self.page_script_hash = msg.new_session.page_script_hash
+        elif kind == 'page_info_changed':
+            self.query_string = msg.page_info_changed.query_string
+        return kind, msg
+
+    def rerun(self, triggers=()):
+        # Send the current widget values (plus any one-shot triggers) and wait for the run
+        back = BackMsg()
+        back.rerun_script.query_string = self.query_string
+        back.rerun_script.page_script_hash = self.page_script_hash
+        back.rerun_script.widget_states.widgets.extend(list(self.values.values()) + list(triggers))
+        self.ws.send(back.SerializeToString())
+
+        errors = []
+        self.widgets = {}
+        while True:
+            kind, msg = self._receive()
+            if kind == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+                element = msg.delta.new_element
+                element_type = element.WhichOneof('type')
+                proto = getattr(element, element_type)
+                if getattr(proto, 'id', None):
+                    self.widgets.setdefault((element_type, getattr(proto, 'label', '')), proto.id)
+                if element_type == 'exception':
+                    errors.append(f"{proto.type}: {proto.message}")
+                elif element_type == 'alert' and proto.format == proto.ERROR:
+                    errors.append(proto.body.strip())
+            elif kind == 'script_finished':
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    errors.append('Script failed to compile')
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return errors
+
+    def widget_id(self, element_type, label=None):
+        for (kind, widget_label), widget_id in self.widgets.items():
+            if kind == element_type and (label is None or widget_label == label):
+                return widget_id
+        raise LookupError(f"No {element_type} widget {label or ''} on the page")
+
+    def set_text(self, label, value):
+        widget_id = self.widget_id('text_input', label)
+        self.values[widget_id] = WidgetState(id=widget_id, string_value=value)
+
+    def click(self, label):
+        return self.rerun([WidgetState(id=self.widget_id('button', label), trigger_value=True)])
+
+    def chat(self, text):
+        widget_id = self.widget_id('chat_input')
+        state = WidgetState(id=widget_id)
+        state.chat_input_value.data = text
+        return self.rerun([state])
+
+    def upload(self, label, files):
+        # Ask the server for upload URLs, PUT each file, then point the widget at them
+        request_id = uuid.uuid4().hex
+        back = BackMsg()
+        back.file_urls_request.request_id = request_id
+        back.file_urls_request.file_names.extend(name for name, _, _ in files)
+        back.file_urls_request.session_id = self.session_id
+        self.ws.send(back.SerializeToString())
+        while True:
+            kind, msg = self._receive()
+            if kind == 'file_urls_response' and msg.file_urls_response.response_id == request_id:
+                break
+
+        widget_id = self.widget_id('file_uploader', label)
+        state = WidgetState(id=widget_id)
+        headers = {'X-Xsrftoken': self.xsrf} if self.xsrf else {}
+        for (name, data, mime), urls in zip(files, msg.file_urls_response.file_urls):
+            self.http.put(
+                self.base_url + urls.upload_url,
+                files={'file': (name, data, mime)},
+                headers=headers,
+                timeout=self.timeout,
+            ).raise_for_status()
+            info = state.file_uploader_state_value.uploaded_file_info.add()
+            info.name, info.size, info.file_id = name, len(data), urls.file_id
+            info.file_urls.CopyFrom(urls)
+        self.values[widget_id] = state
+
+
+# -----------------------------
+# Simulated Sessions
+# -----------------------------
+def sample_files(upload_kb):
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    pdf = io.BytesIO()
+    writer.write(pdf)
+    notes = (b'Meeting notes. ' * 64 * upload_kb)[:upload_kb * 1024]
+    return [
+        ('brand.pdf', pdf.getvalue(), 'application/pdf'),
+        ('notes.txt', notes, 'text/plain'),
+    ]
+
+
+def open_tab(recorder, opts, tab):
+    # A fresh browser session that lands on the app and switches to `tab`
+    session = StreamlitSession(opts.app_url, opts.timeout)
+    if not timed(recorder, 'page_load', session.rerun) or not timed(recorder, 'page_load', lambda: session.click(tab)):
+        session.close()
+        return None
+    return session
+
+
+def chat_session(recorder, n, opts, tab, prefix, upload_labels, submit):
+    session = open_tab(recorder, opts, tab)
+    if not session:
+        return
+    try:
+        session.set_text('Email', f"loadtest{n}@example.com")
+        for label, files in upload_labels(opts.files):
+            session.upload(label, files)
+        if not timed(recorder, f"{prefix}_init", lambda: session.click(submit)):
+            return
+        for turn in range(opts.chat_turns):
+            if not timed(recorder, f"{prefix}_chat", lambda: session.chat(f"Refine point {turn}")):
+                return
+    finally:
+        session.close()
+
+
+def agent2_session(recorder, n, opts):
+    chat_session(
+        recorder, n, opts, 'Agent 2', 'agent2',
+        lambda files: [('Upload files(BRAND DOCUMENT AS PDF, DOCX OR XLSX AND MEETING NOTES AS TXT)', files)],
+        'Get Initial Summary'
+    )
+
+
+def pilars_session(recorder, n, opts):
+    chat_session(
+        recorder, n, opts, 'Pilars agents', 'pilars',
+        lambda files: [
+            ('Upload PDF files', [f for f in files if f[2] == 'application/pdf']),
+            ('Upload TXT files (maximum 3)', [f for f in files if f[2] == 'text/plain']),
+        ],
+        'Process Files'
+    )
+
+
+def pipeline_session(recorder, n, opts):
+    tab = random.choice(['Strategy', 'Master', 'Content Funnel Section', 'Retention + Affinity Generator'])
+    session = open_tab(recorder, opts, tab)
+    if not session:
+        return
+    try:
+        session.set_text('Enter your email address', f"loadtest{n}@example.com")
+        session.upload('Upload files (PDF and TXT only)', opts.files)
+        timed(recorder, 'pipeline_submit', lambda: session.click('Send to n8n Webhook'))
+    finally:
+        session.close()
+
+
+SCENARIOS = [agent2_session, pilars_session, pipeline_session]
+
+
+def session_loop(index, deadline, recorder, opts):
+    # Each pass is a fresh browser session going through one scenario
+    n = 0
+    while time.monotonic() < deadline:
+        try:
+            SCENARIOS[(index + n) % len(SCENARIOS)](recorder, f"{index}-{n}", opts)
+        except Exception:
+            # Connection-level failures (refused, reset, upload rejected)
+            recorder.record('session', 0.0, False)
+        n += 1
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+def run_step(sessions, opts):
+    recorder = Recorder()
+    rss_timeline = []
+    started = time.monotonic()
+    deadline = started + opts.step_seconds
+    rss_start = rss_bytes(opts.app_pid)
+
+    threads = [
+        threading.Thread(target=session_loop, args=(i, deadline, recorder, opts), daemon=True)
+        for i in range(sessions)
+    ]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        rss = rss_bytes(opts.app_pid)
+        if rss is not None:
+            rss_timeline.append((round(time.monotonic() - started, 1), rss / 1e6))
+        time.sleep(1)
+    elapsed = time.monotonic() - started
+
+    # Per-second throughput and error-rate curves
+    timeline = {}
+    for finished, op, seconds, ok in recorder.samples:
+        bucket = timeline.setdefault(int(finished - started), {'ops': 0, 'errors': 0})
+        bucket['ops'] += 1
+        bucket['errors'] += 0 if ok else 1
+
+    operations = {}
+    for op in sorted({s[1] for s in recorder.samples}):
+        latencies = [s[2] for s in recorder.samples if s[1] == op]
+        errors = sum(1 for s in recorder.samples if s[1] == op and not s[3])
+        operations[op] = {
+            'count': len(latencies),
+            'error_rate': errors / len(latencies),
+            'p50_s': percentile(latencies, 0.5),
+            'p95_s': percentile(latencies, 0.95),
+            'p99_s': percentile(latencies, 0.99),
+        }
+
+    total = len(recorder.samples)
+    errors = sum(1 for s in recorder.samples if not s[3])
+    latencies = [s[2] for s in recorder.samples]
+    rss_values = [r for _, r in rss_timeline]
+    return {
+        'sessions': sessions,
+        'elapsed_s': round(elapsed, 1),
+        'operations': total,
+        'throughput_ops_s': total / elapsed if elapsed else 0.0,
+        'error_rate': errors / total if total else 0.0,
+        'p50_s': percentile(latencies, 0.5),
+        'p95_s': percentile(latencies, 0.95),
+        'p99_s': percentile(latencies, 0.99),
+        'rss_start_mb': rss_start / 1e6 if rss_start is not None else None,
+        'rss_peak_mb': max(rss_values) if rss_values else None,
+        'rss_end_mb': rss_values[-1] if rss_values else None,
+        'by_operation': operations,
+        'timeline': [
+            {'second': second, 'ops': b['ops'], 'error_rate': b['errors'] / b['ops']}
+            for second, b in sorted(timeline.items())
+        ],
+        'rss_timeline_mb': rss_timeline,
+    }
+
+
+def print_step(result):
+    fmt = lambda v: '-' if v is None else f"{v:.2f}"
+    growth = (
+        f"{result['rss_peak_mb'] - result['rss_start_mb']:+.1f}"
+        if result['rss_start_mb'] is not None and result['rss_peak_mb'] is not None else '-'
+    )
+    print(
+        f"{result['sessions']:>8} {result['throughput_ops_s']:>10.2f} "
+        f"{fmt(result['p50_s']):>8} {fmt(result['p95_s']):>8} {fmt(result['p99_s']):>8} "
+        f"{result['error_rate'] * 100:>7.1f}% {growth:>10}",
+        flush=True
+    )
+
+
+def start_app(opts, base_url):
+    # Launch `streamlit run fro.py` against the stub, with its local state in a scratch dir
+    scratch = tempfile.mkdtemp(prefix='dtcmode-loadtest-')
+    env = dict(os.environ)
+    env.update({env_var: base_url + path for env_var, path in STUB_ROUTES.items()})
+    env.pop('CALLBACK_BASE_URL', None)
+    env['SESSION_SQLITE_PATH'] = os.path.join(scratch, 'sessions.db')
+    env['ARTIFACT_DIR'] = os.path.join(scratch, 'artifacts')
+    app = subprocess.Popen(
+        [
+            sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+            '--server.port', str(opts.app_port),
+            '--server.headless', 'true',
+            '--server.fileWatcherType', 'none',
+            '--browser.gatherUsageStats', 'false',
+        ],
+        env=env,
+        cwd=scratch,
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(scratch, 'streamlit.log'), 'w'),
+    )
+    app_url = f"http://127.0.0.1:{opts.app_port}"
+    for _ in range(120):
+        if app.poll() is not None:
+            raise SystemExit(f"streamlit exited early; see {scratch}/streamlit.log")
+        try:
+            if requests.get(f"{app_url}/_stcore/health", timeout=1).ok:
+                return app, app_url
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    app.terminate()
+    raise SystemExit(f"streamlit did not become healthy; see {scratch}/streamlit.log")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', default='1,2,4,8,16', help='comma-separated concurrent session counts (default: 1,2,4,8,16)')
+    parser.add_argument('--step-seconds', type=float, default=30, help='how long each step runs (default: 30)')
+    parser.add_argument('--chat-turns', type=int, default=3, help='chat turns per Agent 2 / Pilars session (default: 3)')
+    parser.add_argument('--upload-kb', type=int, default=256, help='size of the TXT file uploaded per session (default: 256)')
+    parser.add_argument('--timeout', type=float, default=300, help='max seconds to wait for one rerun (default: 300)')
+    parser.add_argument('--app-url', help='load-test an already running app instead of starting one')
+    parser.add_argument('--app-pid', type=int, help='PID of the app given by --app-url, for RSS sampling')
+    parser.add_argument('--app-port', type=int, default=8599, help='port for the app started by the harness (default: 8599)')
+    parser.add_argument('--stub-host', default='127.0.0.1', help='stub n8n host (default: 127.0.0.1)')
+    parser.add_argument('--stub-port', type=int, default=0, help='stub n8n port (default: any free port)')
+    parser.add_argument('--stub-latency', type=float, default=0.5, help='mean stub response delay in seconds (default: 0.5)')
+    parser.add_argument('--stub-jitter', type=float, default=0.1, help='std-dev of the stub delay (default: 0.1)')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help='fraction of stub calls that fail with 500 (default: 0)')
+    parser.add_argument('--stub-only', action='store_true', help='only run the stub n8n server until interrupted')
+    parser.add_argument('--out', default='loadtest_results.json', help='JSON file for the full results (default: loadtest_results.json)')
+    opts = parser.parse_args(argv)
+
+    stub = start_stub(opts.stub_host, opts.stub_port, opts.stub_latency, opts.stub_jitter, opts.stub_error_rate)
+    stub_url = f"http://{opts.stub_host}:{stub.server_address[1]}"
+    if opts.stub_only:
+        # Print env lines to point a separately started app at the stub
+        print(f"Stub n8n listening on {stub_url}", file=sys.stderr)
+        for env_var, path in STUB_ROUTES.items():
+            print(f"{env_var}={stub_url}{path}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return 0
+
+    app = None
+    if not opts.app_url:
+        app, opts.app_url = start_app(opts, stub_url)
+        opts.app_pid = app.pid
+
+    opts.files = sample_files(opts.upload_kb)
+    steps = [int(s) for s in opts.steps.split(',') if s.strip()]
+
+    print(f"App {opts.app_url}, stub n8n {stub_url}, {opts.step_seconds:.0f}s per step", file=sys.stderr)
+    print(f"{'sessions':>8} {'ops/s':>10} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'errors':>8} {'RSS +MB':>10}")
+    results = []
+    try:
+        for sessions in steps:
+            result = run_step(sessions, opts)
+            print_step(result)
+            results.append(result)
+    finally:
+        if app:
+            app.terminate()
+            app.wait()
+
+    with open(opts.out, 'w') as f:
+        json.dump({'config': {k: v for k, v in vars(opts).items() if k != 'files'}, 'steps': results}, f, indent=2)
+    print(f"Full results written to {opts.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
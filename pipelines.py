@@ -0,0 +1,47 @@
+import os
+
+# -----------------------------
+# Pipeline Definitions & Upload Rules
+# -----------------------------
+# Shared by the Streamlit app and the headless batch runner so both apply the
+# same limits and send the same payloads to n8n.
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+MAX_TXT_FILES = 3
+
+# pipeline key -> (label, webhook URL env var, max TXT files or None)
+PIPELINES = {
+    'icp': ("ICP's", 'ICP_WEBHOOK_URL', MAX_TXT_FILES),
+    'content_funnel': ('Content Funnel Section', 'CONTENT_FUNNEL_WEBHOOK_URL', None),
+    'conversion_pathway': ('Conversion Pathway Strategy Framework', 'CONVERSION_PATHWAY_WEBHOOK_URL', None),
+    'retention_affinity': ('Retention + Affinity Generator', 'RETENTION_AFFINITY_WEBHOOK_URL', None),
+    'strategy': ('Strategy', 'STRATEGY_WEBHOOK_URL', None),
+    'master': ('Master', 'MASTER_WEBHOOK_URL', None),
+}
+
+
+def webhook_url(pipeline):
+    return os.getenv(PIPELINES[pipeline][1])
+
+
+def file_type(name):
+    return 'application/pdf' if name.lower().endswith('.pdf') else 'text/plain'
+
+
+def upload_error(files, max_txt_files=None):
+    # Validate (name, size) pairs; returns a user-facing message, or None if OK
+    if max_txt_files is not None:
+        txt_count = sum(1 for name, _ in files if file_type(name) == 'text/plain')
+        if txt_count > max_txt_files:
+            return f"Please upload no more than {max_txt_files} TXT files."
+
+    total_size = sum(size for _, size in files)
+    if total_size > MAX_UPLOAD_BYTES:
+        total_size_mb = total_size / (1024 * 1024)
+        return f"The total size of uploaded files ({total_size_mb:.1f} MB) exceeds the 50 MB limit."
+    return None
+
+
+def files_payload(files):
+    # Build the multipart `files` list from (name, bytes) pairs
+    return [('files', (name, data, file_type(name))) for name, data in files]
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+
+# -----------------------------
+# Session Store
+# -----------------------------
+# Conversation state is kept outside the Streamlit process, keyed by session_id,
+# so any worker behind the load balancer can resume a session and nothing is
+# lost when a pod restarts. Results posted back by n8n callbacks are kept in
+# the same backend, keyed by correlation id, so whichever worker receives a
+# callback, any worker can hand the result to the waiting session.
+#
+#   SESSION_BACKEND      sqlite (default) | redis
+#   SESSION_SQLITE_PATH  path of the SQLite file (default: sessions.db)
+#   SESSION_REDIS_URL    redis://host:port/db for any Redis-protocol server
+#   SESSION_TTL_SECONDS  how long an idle session is kept (default: 7 days)
+
+PERSISTED_KEYS = [
+    'messages',
+    'document_texts',
+    'brand_summary',
+    'approved',
+    'agent2_email',
+    'pilars_email',
+    'pdf_artifact',
+    'agent2_init_job',
+    'pipeline_jobs',
+]
+
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self.last_purge = 0.0
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                ' session_id TEXT PRIMARY KEY,'
+                ' state TEXT NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS callbacks ('
+                ' correlation_id TEXT PRIMARY KEY,'
+                ' result TEXT,'
+                ' done INTEGER NOT NULL DEFAULT 0,'
+                ' created_at REAL NOT NULL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads and processes.
+        # sqlite3's own context manager only commits or rolls back, so close explicitly.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT state, updated_at FROM sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+        if not row or row[1] < time.time() - SESSION_TTL_SECONDS:
+            return None
+        return json.loads(row[0])
+
+    def save(self, session_id, state):
+        with self._connect() as conn:
+            # Expired rows are only skipped on load, so delete them now and then
+            if time.time() - self.last_purge > 3600:
+                self.last_purge = time.time()
+                conn.execute('DELETE FROM sessions WHERE updated_at < ?', (time.time() - SESSION_TTL_SECONDS,))
+            conn.execute(
+                'INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at',
+                (session_id, json.dumps(state), time.time())
+            )
+
+    def register_callback(self, correlation_id, ttl):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM callbacks WHERE created_at < ?', (time.time() - ttl,))
+            conn.execute(
+                'INSERT INTO callbacks (correlation_id, created_at) VALUES (?, ?)',
+                (correlation_id, time.time())
+            )
+
+    def complete_callback(self, correlation_id, result):
+        # False when the id is unknown or expired
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE callbacks SET result = ?, done = 1 WHERE correlation_id = ?',
+                (json.dumps(result), correlation_id)
+            )
+        return cursor.rowcount > 0
+
+    def load_callback(self, correlation_id, ttl):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT result, done FROM callbacks WHERE correlation_id = ? AND created_at >= ?',
+                (correlation_id, time.time() - ttl)
+            ).fetchone()
+        if not row:
+            return None
+        return {'done': bool(row[1]), 'result': json.loads(row[0]) if row[0] else None}
+
+    def discard_callback(self, correlation_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM callbacks WHERE correlation_id = ?', (correlation_id,))
+
+
+class RedisSessionStore:
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+
+    def _key(self, session_id):
+        return f"dtcmode:session:{session_id}"
+
+    def load(self, session_id):
+        raw = self.client.get(self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    def save(self, session_id, state):
+        self.client.set(self._key(session_id), json.dumps(state), ex=SESSION_TTL_SECONDS)
+
+    def _callback_key(self, correlation_id):
+        return f"dtcmode:callback:{correlation_id}"
+
+    def register_callback(self, correlation_id, ttl):
+        self.client.set(self._callback_key(correlation_id), json.dumps({'done': False, 'result': None}), ex=ttl)
+
+    def complete_callback(self, correlation_id, result):
+        # xx=True only overwrites a registered, unexpired id; keepttl keeps its expiry
+        return bool(self.client.set(
+            self._callback_key(correlation_id), json.dumps({'done': True, 'result': result}),
+            xx=True, keepttl=True
+        ))
+
+    def load_callback(self, correlation_id, ttl):
+        # Expiry is enforced by Redis
+        raw = self.client.get(self._callback_key(correlation_id))
+        return json.loads(raw) if raw else None
+
+    def discard_callback(self, correlation_id):
+        self.client.delete(self._callback_key(correlation_id))
+
+
+def get_session_store():
+    backend = os.getenv('SESSION_BACKEND', 'sqlite').lower()
+    if backend == 'redis':
+        return RedisSessionStore(os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'))
+    if backend == 'sqlite':
+        return SQLiteSessionStore(os.getenv('SESSION_SQLITE_PATH', 'sessions.db'))
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+
+def snapshot(session_state):
+    # Only the keys that make up a conversation are shared between workers
+    return {key: session_state[key] for key in PERSISTED_KEYS if key in session_state}
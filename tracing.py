@@ -0,0 +1,158 @@
+import io
+import os
+import json
+import random
+import hashlib
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# -----------------------------
+# Rerun Tracing & Slow-Rerun Profiler
+# -----------------------------
+# Every Streamlit rerun gets a trace made of timed spans (extraction, webhook
+# round-trips, JSON parsing, rendering...). Reruns slower than the threshold
+# are written to TRACE_DIR together with a cProfile capture of the script
+# thread, and can be inspected from the Admin tab. Whether a rerun will be slow
+# is only known at the end, so every rerun is profiled by default; lower
+# TRACE_PROFILE_RATE to profile only a sample (0 turns profiling off).
+#
+#   TRACE_DIR                 where slow traces are written (default: traces)
+#   TRACE_SLOW_RERUN_SECONDS  reruns at or above this are kept (default: 5)
+#   TRACE_PROFILE_RATE        fraction of reruns profiled, 0..1 (default: 1)
+#   TRACE_KEEP                number of slow traces kept on disk (default: 200)
+
+TRACE_DIR                = os.getenv('TRACE_DIR', 'traces')
+TRACE_SLOW_RERUN_SECONDS = float(os.getenv('TRACE_SLOW_RERUN_SECONDS', '5'))
+TRACE_PROFILE_RATE       = float(os.getenv('TRACE_PROFILE_RATE', '1'))
+TRACE_KEEP               = int(os.getenv('TRACE_KEEP', '200'))
+
+CORRELATION_HEADER = 'X-Correlation-ID'
+
+# Each rerun runs on its own script thread, so the active trace is per thread
+_local = threading.local()
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.correlation_id = None
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.profiler = None
+
+
+def begin(name):
+    trace = Trace(name)
+    if TRACE_PROFILE_RATE >= 1 or random.random() < TRACE_PROFILE_RATE:
+        trace.profiler = cProfile.Profile()
+        try:
+            trace.profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            trace.profiler = None
+    _local.trace = trace
+    return trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name, **attrs):
+    trace = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.spans.append({
+                'name': name,
+                'start_s': round(start - trace.t0, 4),
+                'duration_s': round(time.perf_counter() - start, 4),
+                **attrs,
+            })
+
+
+def session_tag(session_id):
+    # Stable, non-reversible stand-in for a session id; the raw id is the
+    # ?session= resume credential and must not end up in traces or headers
+    return hashlib.sha256(session_id.encode()).hexdigest()[:16]
+
+
+def correlation_headers():
+    trace = current()
+    if trace is None or not trace.correlation_id:
+        return {}
+    return {CORRELATION_HEADER: trace.correlation_id}
+
+
+def finish(**attrs):
+    # Close the thread's trace; persist it (and its profile) if the rerun was slow
+    trace = current()
+    if trace is None:
+        return None
+    _local.trace = None
+    if trace.profiler:
+        trace.profiler.disable()
+
+    total = time.perf_counter() - trace.t0
+    if total < TRACE_SLOW_RERUN_SECONDS:
+        return total
+
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    trace_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(trace.started_at))}_{trace.correlation_id or 'unknown'}"
+    record = {
+        'trace_id': trace_id,
+        'name': trace.name,
+        'correlation_id': trace.correlation_id,
+        'started_at': trace.started_at,
+        'total_s': round(total, 4),
+        'spans': trace.spans,
+        'has_profile': trace.profiler is not None,
+        **attrs,
+    }
+    if trace.profiler:
+        trace.profiler.dump_stats(os.path.join(TRACE_DIR, f"{trace_id}.prof"))
+    with open(os.path.join(TRACE_DIR, f"{trace_id}.json"), 'w') as f:
+        json.dump(record, f, indent=2)
+    _prune()
+    return total
+
+
+def _prune():
+    traces = sorted(name for name in os.listdir(TRACE_DIR) if name.endswith('.json'))
+    for name in traces[:-TRACE_KEEP] if TRACE_KEEP else []:
+        for ext in ('.json', '.prof'):
+            try:
+                os.unlink(os.path.join(TRACE_DIR, name[:-len('.json')] + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_traces():
+    # Slow traces on disk, newest first
+    if not os.path.isdir(TRACE_DIR):
+        return []
+    traces = []
+    for name in sorted(os.listdir(TRACE_DIR), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(TRACE_DIR, name)) as f:
+                    traces.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return traces
+
+
+def profile_report(trace_id, sort='cumulative', limit=40):
+    path = os.path.join(TRACE_DIR, f"{os.path.basename(trace_id)}.prof")
+    if not os.path.exists(path):
+        return None
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import requests
+
+import tracing
+
+# -----------------------------
+# Webhook Admission Control
+# -----------------------------
+# Every Streamlit session in this process shares one queue per endpoint.
+# At most WEBHOOK_MAX_CONCURRENCY requests run against an endpoint at once;
+# the rest wait, and free slots are handed out round-robin across tenants
+# (email or session) so one busy team cannot starve everybody else. When more
+# than WEBHOOK_MAX_QUEUE requests are already waiting, new ones are refused
+# straight away, and tickets whose caller went away are cancelled before they
+# ever reach n8n.
+
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '4'))
+WEBHOOK_MAX_WORKERS     = int(os.getenv('WEBHOOK_MAX_WORKERS', '64'))
+WEBHOOK_MAX_QUEUE       = int(os.getenv('WEBHOOK_MAX_QUEUE', '32'))
+
+
+class WebhookBusy(Exception):
+    pass
+
+
+class Ticket:
+    def __init__(self, endpoint, tenant, call):
+        self.endpoint = endpoint
+        self.tenant = tenant
+        self.call = call
+        self.future = Future()
+        self.granted = False
+
+
+class EndpointQueue:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        # tenant -> deque of waiting tickets, in round-robin order
+        self.waiting = OrderedDict()
+
+
+class AdmissionController:
+    def __init__(self, limit, executor, max_queue=None):
+        self.limit = limit
+        self.executor = executor
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def submit(self, endpoint, tenant, call):
+        # Queue `call` for `endpoint`; the returned ticket's future holds its result
+        ticket = Ticket(endpoint, tenant, call)
+        with self.lock:
+            queue = self.queues.setdefault(endpoint, EndpointQueue(self.limit))
+            if self.max_queue is not None and sum(len(q) for q in queue.waiting.values()) >= self.max_queue:
+                # Fail fast instead of growing an unbounded backlog
+                ticket.future.set_exception(WebhookBusy('This service is busy right now, please try again in a few minutes.'))
+                return ticket
+            queue.waiting.setdefault(tenant, deque()).append(ticket)
+            self._dispatch(queue)
+        return ticket
+
+    def cancel(self, ticket):
+        # Drop a ticket that is still waiting; returns False once it was granted or finished
+        with self.lock:
+            if ticket.granted or ticket.future.done():
+                return False
+            queue = self.queues[ticket.endpoint]
+            tickets = queue.waiting[ticket.tenant]
+            tickets.remove(ticket)
+            if not tickets:
+                del queue.waiting[ticket.tenant]
+            ticket.future.cancel()
+            return True
+
+    def position(self, ticket):
+        # 1-based place in line, or 0 once the request is running
+        with self.lock:
+            if ticket.granted or ticket.future.done():
+                return 0
+            queue = self.queues[ticket.endpoint]
+            tenants = list(queue.waiting)
+            mine = tenants.index(ticket.tenant)
+            k = queue.waiting[ticket.tenant].index(ticket)
+            ahead = 0
+            for i, tenant in enumerate(tenants):
+                ahead += min(len(queue.waiting[tenant]), k + 1 if i < mine else k)
+            return ahead + 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                endpoint: {
+                    'active': queue.active,
+                    'limit': queue.limit,
+                    'waiting': sum(len(q) for q in queue.waiting.values()),
+                    'tenants_waiting': len(queue.waiting),
+                }
+                for endpoint, queue in self.queues.items()
+            }
+
+    def _dispatch(self, queue):
+        # Called with the lock held: start waiting tickets while slots are free
+        while queue.active < queue.limit and queue.waiting:
+            tenant, tickets = queue.waiting.popitem(last=False)
+            ticket = tickets.popleft()
+            if tickets:
+                # Tenant goes to the back of the rotation
+                queue.waiting[tenant] = tickets
+            ticket.granted = True
+            queue.active += 1
+            self.executor.submit(self._run, queue, ticket)
+
+    def _run(self, queue, ticket):
+        try:
+            ticket.future.set_result(ticket.call())
+        except BaseException as e:
+            ticket.future.set_exception(e)
+        finally:
+            with self.lock:
+                queue.active -= 1
+                self._dispatch(queue)
+
+
+# -----------------------------
+# Adaptive Timeouts
+# -----------------------------
+# Each endpoint keeps a window of recent round-trip latencies. Once the window
+# holds enough samples for a real tail, the read timeout is the observed p99
+# times a safety margin, plus an allowance per MB of the request being sent,
+# clamped to the configured floor and ceiling. Until then the endpoint keeps
+# the default. Connecting does not depend on how long a workflow runs, so the
+# connect timeout is a separate fixed value.
+
+WEBHOOK_TIMEOUT_DEFAULT = float(os.getenv('WEBHOOK_TIMEOUT_DEFAULT', '180'))
+WEBHOOK_TIMEOUT_FLOOR   = float(os.getenv('WEBHOOK_TIMEOUT_FLOOR', '15'))
+WEBHOOK_TIMEOUT_CEILING = float(os.getenv('WEBHOOK_TIMEOUT_CEILING', '600'))
+WEBHOOK_TIMEOUT_MARGIN  = float(os.getenv('WEBHOOK_TIMEOUT_MARGIN', '1.5'))
+WEBHOOK_SECONDS_PER_MB  = float(os.getenv('WEBHOOK_SECONDS_PER_MB', '2'))
+WEBHOOK_CONNECT_TIMEOUT = float(os.getenv('WEBHOOK_CONNECT_TIMEOUT', '10'))
+WEBHOOK_LATENCY_WINDOW  = int(os.getenv('WEBHOOK_LATENCY_WINDOW', '200'))
+WEBHOOK_MIN_SAMPLES     = int(os.getenv('WEBHOOK_MIN_SAMPLES', '50'))
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class EndpointLatency:
+    def __init__(self):
+        # Raw round-trip seconds per request, upload included
+        self.samples = deque(maxlen=WEBHOOK_LATENCY_WINDOW)
+        self.ewma = None
+        self.timeouts = 0
+
+    def percentile(self, q):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LatencyTracker:
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, seconds, timed_out=False):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointLatency())
+            stats.samples.append(seconds)
+            stats.ewma = seconds if stats.ewma is None else self.alpha * seconds + (1 - self.alpha) * stats.ewma
+            if timed_out:
+                stats.timeouts += 1
+
+    def timeout(self, endpoint, payload_bytes=0):
+        # (connect, read) timeout tuple for a request of the given size
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if not stats or len(stats.samples) < WEBHOOK_MIN_SAMPLES:
+                # Too few samples to know the tail; a short history of quick
+                # calls must not cut off the occasional slow one
+                read = WEBHOOK_TIMEOUT_DEFAULT
+            else:
+                read = stats.percentile(0.99) * WEBHOOK_TIMEOUT_MARGIN
+            read += payload_bytes / 1e6 * WEBHOOK_SECONDS_PER_MB
+        return (
+            WEBHOOK_CONNECT_TIMEOUT,
+            clamp(read, WEBHOOK_TIMEOUT_FLOOR, WEBHOOK_TIMEOUT_CEILING),
+        )
+
+    def stats(self):
+        with self.lock:
+            endpoints = {
+                endpoint: {
+                    'samples': len(stats.samples),
+                    'ewma_s': stats.ewma,
+                    'p50_s': stats.percentile(0.5),
+                    'p99_s': stats.percentile(0.99),
+                    'timeouts': stats.timeouts,
+                }
+                for endpoint, stats in self.endpoints.items() if stats.samples
+            }
+        for endpoint, row in endpoints.items():
+            row['connect_timeout_s'], row['read_timeout_s'] = self.timeout(endpoint)
+        return endpoints
+
+
+def payload_size(kwargs):
+    # Rough request body size, used to stretch the read timeout for big uploads
+    size = 0
+    for _, spec in kwargs.get('files') or []:
+        size += len(spec[1])
+    if kwargs.get('json') is not None:
+        size += len(json.dumps(kwargs['json']))
+    return size
+
+
+latency = LatencyTracker()
+
+admission = AdmissionController(
+    WEBHOOK_MAX_CONCURRENCY,
+    ThreadPoolExecutor(max_workers=WEBHOOK_MAX_WORKERS, thread_name_prefix='webhook'),
+    WEBHOOK_MAX_QUEUE
+)
+
+
+class WebhookJob:
+    def __init__(self, ticket, timeout):
+        self.ticket = ticket
+        # (connect, read) seconds chosen for this request
+        self.timeout = timeout
+
+    def result(self, timeout=None):
+        return self.ticket.future.result(timeout)
+
+    def done(self):
+        return self.ticket.future.done()
+
+    def wait(self, timeout=None):
+        # True once the request has finished (successfully or not)
+        return bool(wait([self.ticket.future], timeout).done)
+
+    def queue_position(self):
+        return admission.position(self.ticket)
+
+    def cancel(self):
+        # Withdraw the request if it has not been sent yet
+        return admission.cancel(self.ticket)
+
+
+def submit_webhook(url, tenant, **kwargs):
+    # POST to an n8n webhook through the shared per-endpoint queue,
+    # with a timeout picked from that endpoint's latency history
+    size = payload_size(kwargs)
+    timeout = kwargs.pop('timeout', None) or latency.timeout(url, size)
+    if isinstance(timeout, (int, float)):
+        timeout = (timeout, timeout)
+    # Tag the request with the caller's rerun so n8n executions can be matched to traces;
+    # read here because call() runs on a pool thread without the trace
+    headers = {**tracing.correlation_headers(), **(kwargs.pop('headers', None) or {})}
+    if headers:
+        kwargs['headers'] = headers
+
+    def call():
+        started = time.monotonic()
+        try:
+            resp = requests.post(url, timeout=timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            # Count the full timeout so repeated stalls widen the window
+            latency.record(url, time.monotonic() - started, timed_out=True)
+            raise
+        latency.record(url, time.monotonic() - started)
+        return resp
+
+    return WebhookJob(admission.submit(url, tenant, call), timeout)